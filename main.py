@@ -13,8 +13,19 @@ def main():
     parser.add_argument('input_path', help='File or directory to process')
     parser.add_argument('-o', '--output', default='captions.csv', help='Output CSV file')
     parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output')
-    parser.add_argument('--batch', action='store_true', help='Optimize for processing many files (enables faster tokenizer)')
+    parser.add_argument('--batch', action='store_true', help='Optimize for processing many files (greedy decoding unless --num-beams is given)')
+    parser.add_argument('--batch-size', type=int, default=8, help='Number of files captioned per model call (default: 8)')
+    parser.add_argument('--num-workers', type=int, default=4, help='Threads used to decode images and videos (default: 4)')
+    parser.add_argument('--prefetch', type=int, default=2, help='Batches decoded ahead of the model, plus up to --num-workers files in flight (default: 2)')
+    parser.add_argument('--compile', action='store_true', help='Compile the model with torch.compile (slow first batch, faster afterwards)')
+    parser.add_argument('--gpu-preprocess', action='store_true', help='Resize and normalize images on the GPU instead of the CPU')
+    parser.add_argument('--num-beams', type=int, default=None,
+                       help='Beam search width; higher is slower but can give better captions (default: 5, or 1 with --batch)')
+    parser.add_argument('--quant', choices=['none', 'int8', 'fp16'], default='none',
+                       help='Model quantization: int8 (bitsandbytes on CUDA, dynamic quantization on CPU) or fp16 (CUDA only) (default: none)')
+    parser.add_argument('--max-length', type=int, default=50, help='Maximum caption length in tokens (default: 50)')
     parser.add_argument('--no-skip', action='store_true', help='Process all files even if already processed in CSV (default: skip existing)')
+    parser.add_argument('--no-sort', action='store_true', help='Process files in path order instead of sorting them by size (default: sort by size)')
     parser.add_argument('--no-continuous', action='store_true', help='Disable continuous saving (default: save after each file)')
     parser.add_argument('--format', choices=['basic', 'detailed'], default='detailed', 
                        help='CSV output format: basic (filename, caption) or detailed (includes file info, dimensions, date) (default: detailed)')
@@ -31,7 +42,16 @@ def main():
         batch_mode=args.batch,
         skip_existing=not args.no_skip,  
         continuous_save=not args.no_continuous,  
-        format_type=args.format
+        format_type=args.format,
+        batch_size=args.batch_size,
+        compile_model=args.compile,
+        num_workers=args.num_workers,
+        prefetch=args.prefetch,
+        gpu_preprocess=args.gpu_preprocess,
+        num_beams=args.num_beams,
+        max_length=args.max_length,
+        sort_by_size=not args.no_sort,
+        quantization=args.quant
     )
     tagger.process(input_path, args.output)
 
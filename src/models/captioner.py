@@ -1,23 +1,58 @@
 from PIL import Image
 from transformers import BlipProcessor, BlipForConditionalGeneration
+from torchvision.transforms import v2
+import numpy as np
 import torch
 import logging
+from typing import List, Optional, Union
 
 
 class ImageCaptioner:
     """BLIP model wrapper for image captioning."""
     
-    def __init__(self, model_name: str = "Salesforce/blip-image-captioning-base", use_fast: bool = False):
+    def __init__(self, model_name: str = "Salesforce/blip-image-captioning-base", use_fast: bool = True,
+                 compile_model: bool = False, gpu_preprocess: bool = False,
+                 static_batch_size: Optional[int] = None, num_beams: int = 5, max_length: int = 50,
+                 repetition_penalty: float = 1.2, no_repeat_ngram_size: int = 2, quantization: str = "none"):
         self.logger = logging.getLogger(__name__)
         self.logger.info("Loading BLIP model...")
         
-        self.processor = BlipProcessor.from_pretrained(model_name, use_fast=use_fast)
-        self.model = BlipForConditionalGeneration.from_pretrained(model_name)
+        self.generation_kwargs = {
+            'max_length': max_length,
+            'num_beams': num_beams,
+            'repetition_penalty': repetition_penalty,
+            'no_repeat_ngram_size': no_repeat_ngram_size,
+        }
         
         self.device = self._select_device()
-        self.model.to(self.device)
+        self.quantization = self._select_quantization(quantization)
+        self.dtype = self._select_dtype()
+        
+        self.processor = BlipProcessor.from_pretrained(model_name, use_fast=use_fast)
+        image_processor = self.processor.image_processor
+        self.image_size = [image_processor.size["height"], image_processor.size["width"]]
+        self.image_mean = image_processor.image_mean
+        self.image_std = image_processor.image_std
+        
+        self.gpu_preprocess = gpu_preprocess and self.device == "cuda"
+        if gpu_preprocess and not self.gpu_preprocess:
+            self.logger.warning("GPU preprocessing needs CUDA, preprocessing on CPU instead")
         
-        self.logger.info(f"Model loaded on {self.device}")
+        self.model = self._load_model(model_name)
+        if self.quantization != "int8":
+            self.model.to(self.device)
+        self.model.eval()
+        if self.quantization == "int8" and self.device == "cpu":
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        
+        # Padding only pays off where reduce-overhead records CUDA graphs.
+        self.static_batch_size = static_batch_size if compile_model and self.device == "cuda" else None
+        if compile_model:
+            self._compile()
+            self._warmup()
+        
+        precision = "int8" if self.quantization == "int8" else self.dtype
+        self.logger.info("Model loaded on %s (%s)", self.device, precision)
     
     def _select_device(self) -> str:
         """Select the best available device."""
@@ -25,17 +60,132 @@ class ImageCaptioner:
             return "cuda"
         return "cpu"
     
+    def _select_quantization(self, quantization: str) -> str:
+        """Check that the requested quantization works on the chosen device, downgrading if not.
+        
+        int8 uses bitsandbytes and accelerate on CUDA and dynamic Linear quantization on
+        the CPU; fp16 only applies on CUDA.
+        """
+        if quantization == "int8" and self.device == "cuda":
+            try:
+                import bitsandbytes  # noqa: F401
+                import accelerate  # noqa: F401
+            except ImportError as e:
+                self.logger.warning("int8 quantization on CUDA needs bitsandbytes and accelerate (%s), "
+                                    "using the default precision instead", e)
+                return "none"
+        elif quantization == "fp16" and self.device != "cuda":
+            self.logger.warning("fp16 quantization needs CUDA, using the default precision instead")
+            return "none"
+        return quantization
+    
+    def _select_dtype(self) -> torch.dtype:
+        """Select the model precision for the chosen device."""
+        if self.device == "cuda":
+            if self.quantization in ("fp16", "int8"):
+                return torch.float16
+            return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        return torch.float32
+    
+    def _load_model(self, model_name: str) -> BlipForConditionalGeneration:
+        """Load the model in the selected precision.
+        
+        BLIP has no SDPA attention backend in transformers, so it always runs its own
+        (eager) attention.
+        """
+        kwargs = {'torch_dtype': self.dtype}
+        if self.quantization == "int8" and self.device == "cuda":
+            from transformers import BitsAndBytesConfig
+            kwargs['quantization_config'] = BitsAndBytesConfig(load_in_8bit=True)
+            kwargs['device_map'] = "auto"
+        
+        self.logger.info("BLIP has no SDPA attention backend in transformers, using eager attention")
+        return BlipForConditionalGeneration.from_pretrained(model_name, **kwargs)
+    
+    def _compile(self):
+        """Compile the vision encoder and text decoder with torch.compile.
+        
+        generate() never goes through model.forward, so the submodules it calls are compiled instead.
+        On CUDA, reduce-overhead mode records CUDA graphs per input shape. Batches are padded
+        to static_batch_size so the batch dimension stays fixed and fewer graphs are recorded;
+        the decoder's sequence length still grows every step, so it keeps recording new shapes.
+        """
+        self.model.vision_model.forward = torch.compile(self.model.vision_model.forward, mode="reduce-overhead", fullgraph=False)
+        self.model.text_decoder.forward = torch.compile(self.model.text_decoder.forward, mode="reduce-overhead", fullgraph=False)
+    
+    def _warmup(self):
+        """Run one dummy batch so graph capture happens at load time, not on the first files."""
+        self.logger.info("Warming up compiled model...")
+        batch_size = self.static_batch_size or 1
+        dummy = torch.zeros(batch_size, 3, *self.image_size, device=self.device, dtype=self.dtype)
+        self.caption_from_tensor(dummy)
+    
     def caption(self, image: Image.Image) -> str:
         """Generate caption for a PIL Image."""
         try:
-            inputs = self.processor(image, return_tensors="pt").to(self.device)
-            
-            with torch.no_grad():
-                out = self.model.generate(**inputs, max_length=50, num_beams=5, repetition_penalty=1.2, no_repeat_ngram_size=2)
-            
-            caption = self.processor.decode(out[0], skip_special_tokens=True)
-            return caption.strip()
+            return self.caption_batch([image], pad=False)[0]
             
         except Exception as e:
-            self.logger.error(f"Caption generation failed: {e}")
-            return "Caption generation failed"
\ No newline at end of file
+            self.logger.error("Caption generation failed: %s", e)
+            return "Caption generation failed"
+    
+    def caption_batch(self, images: Union[List[Image.Image], np.ndarray], pad: bool = True) -> List[str]:
+        """Generate captions for several images with a single generate call.
+        
+        Images can be PIL Images or an (N, H, W, 3) RGB uint8 array such as extracted video frames.
+        Unlike caption(), errors are raised so callers can fall back to per-image captioning.
+        On CUDA the preprocessed batch is copied from pinned memory without blocking the host.
+        pad=False skips padding to static_batch_size, for single images and video frames.
+        """
+        if self.gpu_preprocess:
+            pixel_values = self._preprocess_on_device(images)
+        else:
+            pixel_values = self.processor.image_processor(list(images), return_tensors="pt")["pixel_values"]
+            if self.device == "cuda":
+                pixel_values = pixel_values.pin_memory()
+            pixel_values = pixel_values.to(self.device, self.dtype, non_blocking=True)
+        
+        return self.caption_from_tensor(pixel_values, pad=pad)
+    
+    def caption_from_tensor(self, pixel_values: torch.Tensor, pad: bool = True) -> List[str]:
+        """Generate captions for already preprocessed pixel_values on the model device.
+        
+        With a compiled model on CUDA, batches are padded to static_batch_size unless pad is False.
+        """
+        if self.static_batch_size is None or not pad:
+            return self._generate(pixel_values)
+        
+        captions = []
+        for chunk in pixel_values.split(self.static_batch_size):
+            count = len(chunk)
+            if count < self.static_batch_size:
+                padding = chunk[-1:].expand(self.static_batch_size - count, *chunk.shape[1:])
+                chunk = torch.cat([chunk, padding])
+            captions.extend(self._generate(chunk)[:count])
+        return captions
+    
+    def _generate(self, pixel_values: torch.Tensor) -> List[str]:
+        """Run generation on a batch of pixel_values and decode the captions."""
+        with torch.inference_mode(), torch.autocast(self.device, dtype=self.dtype, enabled=self.device == "cuda"):
+            out = self.model.generate(pixel_values=pixel_values, **self.generation_kwargs)
+        
+        captions = self.processor.batch_decode(out, skip_special_tokens=True)
+        return [caption.strip() for caption in captions]
+    
+    def _preprocess_on_device(self, images: Union[List[Image.Image], np.ndarray]) -> torch.Tensor:
+        """Resize and normalize images on the GPU, mirroring BlipImageProcessor.
+        
+        Each image is copied to the device as uint8 from pinned memory, so only
+        the raw pixels cross the bus and the float math runs on the GPU.
+        """
+        resized = []
+        for image in images:
+            pixels = image if isinstance(image, np.ndarray) else np.array(image)
+            pixels = torch.from_numpy(pixels).permute(2, 0, 1)
+            pixels = pixels.pin_memory().to(self.device, non_blocking=True)
+            pixels = v2.functional.to_dtype(pixels, torch.float32, scale=True)
+            pixels = v2.functional.resize(pixels, self.image_size, interpolation=v2.InterpolationMode.BICUBIC, antialias=True)
+            resized.append(pixels.clamp_(0.0, 1.0))
+        
+        pixel_values = v2.functional.normalize(torch.stack(resized), self.image_mean, self.image_std)
+        return pixel_values.to(self.dtype)
\ No newline at end of file
@@ -1,6 +1,7 @@
 from PIL import Image
 from pathlib import Path
 import logging
+from typing import Tuple
 
 
 class ImageProcessor:
@@ -9,16 +10,27 @@ class ImageProcessor:
     def __init__(self, captioner):
         self.captioner = captioner
         self.logger = logging.getLogger(__name__)
+        height, width = captioner.image_size
+        self.draft_size = (width, height)
     
     def process(self, file_path: Path) -> str:
         """Process a single image file."""
+        image, _ = self.load(file_path)
+        return self.captioner.caption(image)
+    
+    def load(self, file_path: Path) -> Tuple[Image.Image, Tuple[int, int]]:
+        """Open an image file and return it decoded as RGB with its original (width, height).
+        
+        JPEGs are decoded at the smallest DCT scale that still covers the model input
+        size, since the captioner downscales them anyway.
+        """
         try:
             with Image.open(file_path) as img:
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                return self.captioner.caption(img)
+                size = img.size
+                if img.format == 'JPEG':
+                    img.draft('RGB', self.draft_size)
+                return img.convert('RGB'), size
                 
         except Exception as e:
-            self.logger.error(f"Failed to process image {file_path}: {e}")
+            self.logger.error("Failed to process image %s: %s", file_path, e)
             raise
\ No newline at end of file
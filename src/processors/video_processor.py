@@ -1,50 +1,75 @@
 import cv2
-from PIL import Image
+import numpy as np
 from pathlib import Path
 import logging
-from typing import List
+from typing import List, Optional, Tuple
 
 
 class VideoProcessor:
     """Process videos and GIFs for captioning."""
     
-    def __init__(self, captioner, max_frames: int = 5):
+    def __init__(self, captioner, max_frames: int = 5, duplicate_threshold: int = 4,
+                 decode_threads: Optional[int] = None):
         self.captioner = captioner
         self.max_frames = max_frames
+        self.duplicate_threshold = duplicate_threshold
+        self.decode_threads = decode_threads
         self.logger = logging.getLogger(__name__)
     
     def process(self, file_path: Path) -> str:
         """Process a video file by captioning key frames."""
+        (frames, frame_index), _ = self.load(file_path)
+        return self.caption(frames, frame_index)
+    
+    def load(self, file_path: Path) -> Tuple[Tuple[np.ndarray, List[int]], Optional[Tuple[int, int]]]:
+        """Extract the distinct key frames of a video file along with the frame (width, height).
+        
+        Returns (frames, frame_index), where frame_index maps every sampled frame to
+        the distinct frame that stands in for it. The size is None when no frame
+        could be decoded.
+        """
         try:
             frames = self._extract_frames(file_path)
-            if not frames:
-                return "No frames extracted from video"
-            
-            captions = []
-            for i, frame in enumerate(frames):
-                caption = self.captioner.caption(frame)
-                captions.append(caption)
-                self.logger.debug(f"Frame {i+1}: {caption}")
-            
-            return " | ".join(captions)
+            size = (frames.shape[2], frames.shape[1]) if len(frames) else None
+            return self._deduplicate(frames), size
             
         except Exception as e:
-            self.logger.error(f"Failed to process video {file_path}: {e}")
+            self.logger.error("Failed to process video %s: %s", file_path, e)
             raise
     
-    def _extract_frames(self, file_path: Path) -> List[Image.Image]:
-        """Extract key frames from video."""
+    def caption(self, frames: np.ndarray, frame_index: Optional[List[int]] = None) -> str:
+        """Caption extracted key frames and join them into a single description.
+        
+        With a frame_index from load(), each distinct frame is captioned once and its
+        caption repeated for the sampled frames it stands in for.
+        """
+        if len(frames) == 0:
+            return "No frames extracted from video"
+        
+        # A handful of (deduplicated) frames is cheaper unpadded than padded to a full batch.
+        captions = self.captioner.caption_batch(frames, pad=False)
+        if frame_index is not None:
+            captions = [captions[i] for i in frame_index]
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for i, caption in enumerate(captions):
+                self.logger.debug("Frame %d: %s", i + 1, caption)
+        
+        return " | ".join(captions)
+    
+    def _extract_frames(self, file_path: Path) -> np.ndarray:
+        """Extract key frames from video as an (N, H, W, 3) RGB uint8 array."""
 
-        video = cv2.VideoCapture(str(file_path))
+        video = self._open_capture(file_path)
         
         if not video.isOpened():
             raise ValueError(f"Could not open video file: {file_path}")
         
         total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
         
-        if total_frames == 0:
+        # Containers without a duration (e.g. MediaRecorder .webm) report a negative count.
+        if total_frames <= 0:
             video.release()
-            return []
+            return np.empty((0, 0, 0, 3), dtype=np.uint8)
         
         if total_frames <= self.max_frames:
             frame_indices = list(range(total_frames))
@@ -52,15 +77,93 @@ class VideoProcessor:
             step = total_frames // self.max_frames
             frame_indices = [i * step for i in range(self.max_frames)]
         
-        frames = []
+        if total_frames > 10 * self.max_frames:
+            frames = self._read_by_seeking(video, frame_indices)
+        else:
+            frames = self._read_sequentially(video, frame_indices)
+        
+        video.release()
+        return frames
+    
+    def _open_capture(self, file_path: Path) -> cv2.VideoCapture:
+        """Open a video, limiting the decoder to decode_threads threads when set.
+        
+        Several videos decode at once on the tagger's worker pool, so each capture
+        only gets its share of the CPUs. OpenCV builds without CAP_PROP_N_THREADS
+        keep the backend's default.
+        """
+        if self.decode_threads and hasattr(cv2, 'CAP_PROP_N_THREADS'):
+            return cv2.VideoCapture(str(file_path), cv2.CAP_ANY, [cv2.CAP_PROP_N_THREADS, self.decode_threads])
+        return cv2.VideoCapture(str(file_path))
+    
+    def _deduplicate(self, frames: np.ndarray) -> Tuple[np.ndarray, List[int]]:
+        """Drop frames that look like the previous distinct frame, using an 8x8 average hash.
+        
+        A frame is a duplicate when its hash differs from the last kept frame's in at
+        most duplicate_threshold bits, as happens in static scenes and slideshows.
+        """
+        keep = []
+        frame_index = []
+        previous_hash = None
+        
+        for frame in frames:
+            gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+            small = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+            frame_hash = int.from_bytes(np.packbits(small > small.mean()).tobytes(), 'big')
+            if previous_hash is None or bin(frame_hash ^ previous_hash).count('1') > self.duplicate_threshold:
+                keep.append(len(frame_index))
+                previous_hash = frame_hash
+            frame_index.append(len(keep) - 1)
+        
+        if len(keep) == len(frames):
+            return frames, frame_index
+        return frames[keep], frame_index
+    
+    def _read_sequentially(self, video: cv2.VideoCapture, frame_indices: List[int]) -> np.ndarray:
+        """Read frames by walking the stream once, only decoding the wanted indices.
+        
+        Frame seeks re-decode from the previous keyframe, so for short clips
+        grabbing every frame in order is cheaper.
+        """
+        wanted = set(frame_indices)
+        frames = None
+        count = 0
+        
+        for frame_index in range(frame_indices[-1] + 1):
+            if not video.grab():
+                break
+            if frame_index in wanted:
+                ret, frame = video.retrieve()
+                if ret:
+                    frames = self._store_frame(frames, count, frame, len(frame_indices))
+                    count += 1
+        
+        return self._trim(frames, count)
+    
+    def _read_by_seeking(self, video: cv2.VideoCapture, frame_indices: List[int]) -> np.ndarray:
+        """Read frames of a long video by seeking to each sampled frame."""
+        frames = None
+        count = 0
+        
         for frame_index in frame_indices:
             video.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
             ret, frame = video.read()
             
             if ret:
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                pil_image = Image.fromarray(frame_rgb)
-                frames.append(pil_image)
+                frames = self._store_frame(frames, count, frame, len(frame_indices))
+                count += 1
         
-        video.release()
-        return frames
\ No newline at end of file
+        return self._trim(frames, count)
+    
+    def _store_frame(self, frames: Optional[np.ndarray], count: int, frame: np.ndarray, capacity: int) -> np.ndarray:
+        """Convert a BGR frame to RGB directly into the preallocated frame buffer."""
+        if frames is None:
+            frames = np.empty((capacity, *frame.shape), dtype=np.uint8)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frames[count])
+        return frames
+    
+    def _trim(self, frames: Optional[np.ndarray], count: int) -> np.ndarray:
+        """Drop unused buffer slots for frames that failed to decode."""
+        if frames is None:
+            return np.empty((0, 0, 0, 3), dtype=np.uint8)
+        return frames[:count]
@@ -1,8 +1,13 @@
 import csv
+import io
 from pathlib import Path
-from typing import List, Tuple, Set, Dict
+from typing import List, Tuple, Set, Dict, Union, Any, Iterator, Optional
 import logging
 import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from tqdm import tqdm
 from PIL import Image
@@ -12,34 +17,91 @@ from .processors.image_processor import ImageProcessor
 from .processors.video_processor import VideoProcessor
 
 
+def _scan(directory: str, extensions: frozenset) -> List[str]:
+    """Recursively list files under directory whose lowercase suffix is in extensions.
+    
+    Uses os.scandir with an explicit stack instead of Path.rglob, so no Path objects are
+    built for rejected entries. Symlinked directories are not followed.
+    """
+
+    files = []
+    stack = [directory]
+    
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file():
+                    files.append(entry.path)
+    
+    return files
+
+
 class AITagger:
     """Tags images and videos."""
     
     SUPPORTED_IMAGES = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
     SUPPORTED_VIDEOS = {'.mp4', '.avi', '.mov', '.mkv', '.gif', '.webm'}
+    _IMAGE_EXTENSIONS = frozenset(SUPPORTED_IMAGES)
+    _VIDEO_EXTENSIONS = frozenset(SUPPORTED_VIDEOS)
+    _SUPPORTED_EXTENSIONS = _IMAGE_EXTENSIONS | _VIDEO_EXTENSIONS
+    _WRITE_CHUNK = 128
+    _CSV_BUFFER_SIZE = 1 << 16
     
     def __init__(self, verbose: bool = False, batch_mode: bool = False, 
-                 skip_existing: bool = True, continuous_save: bool = True, format_type: str = 'detailed'):
+                 skip_existing: bool = True, continuous_save: bool = True, format_type: str = 'detailed',
+                 batch_size: int = 8, compile_model: bool = False, num_workers: int = 4, prefetch: int = 2,
+                 force_flush_after: int = 32, gpu_preprocess: bool = False, num_beams: Optional[int] = None,
+                 max_length: int = 50, repetition_penalty: float = 1.2, no_repeat_ngram_size: int = 2,
+                 sort_by_size: bool = True, quantization: str = 'none'):
         self.verbose = verbose
-        self.use_fast = batch_mode 
         self.batch_mode = batch_mode
+        self.batch_size = max(1, batch_size)
+        self.compile_model = compile_model
+        self.num_workers = max(1, num_workers)
+        self.prefetch = max(1, prefetch)
+        self.gpu_preprocess = gpu_preprocess
+        # Beam search costs roughly num_beams times greedy decoding; batch mode trades
+        # a little caption quality for throughput unless beams are set explicitly.
+        self.num_beams = num_beams if num_beams is not None else (1 if batch_mode else 5)
+        self.max_length = max_length
+        self.repetition_penalty = repetition_penalty
+        self.no_repeat_ngram_size = no_repeat_ngram_size
+        self.sort_by_size = sort_by_size
+        self.quantization = quantization
         self.skip_existing = skip_existing
         self.continuous_save = continuous_save
         self.format_type = format_type  
+        self.force_flush_after = max(1, force_flush_after)
+        self._csv_fh = None
+        self._rows_since_flush = 0
+        self._file_sizes: Dict[Path, int] = {}
+        self._progress = None
         self._setup_logging()
         
         if self.verbose:
             if self.batch_mode:
                 print("Batch mode on")
+            print(f"Captioning with {self.num_beams} beam(s)")
             if self.skip_existing:
                 print("Will skip files already in CSV")
             if self.continuous_save:
                 print("Saving as we go")
         
         print("Loading AI models...")
-        self.captioner = ImageCaptioner(use_fast=self.use_fast)
+        self.captioner = ImageCaptioner(compile_model=self.compile_model, gpu_preprocess=self.gpu_preprocess,
+                                        static_batch_size=self.batch_size, num_beams=self.num_beams,
+                                        max_length=self.max_length, repetition_penalty=self.repetition_penalty,
+                                        no_repeat_ngram_size=self.no_repeat_ngram_size,
+                                        quantization=self.quantization)
         self.image_processor = ImageProcessor(self.captioner)
-        self.video_processor = VideoProcessor(self.captioner)
+        decode_threads = max(1, (os.cpu_count() or 1) // self.num_workers)
+        self.video_processor = VideoProcessor(self.captioner, decode_threads=decode_threads)
         print("Models loaded!")
         
     def _setup_logging(self):
@@ -50,9 +112,6 @@ class AITagger:
     def process(self, input_path: Path, output_file: str):
         """Process files and write results to CSV."""
 
-        if self.continuous_save:
-            self._ensure_csv_headers(output_file)
-        
         existing_files = set()
         if self.skip_existing:
             existing_files = self._get_existing_files(output_file)
@@ -75,45 +134,38 @@ class AITagger:
                 print("All files already processed!")
                 return
         
+        if self.sort_by_size:
+            files_to_process = self._sort_by_size(files_to_process)
+        
         results = []
-        total_files = len(files_to_process)
+        write_errors = []
+        # The reader's in-flight window plus this queue hold about prefetch batches.
+        decode_q = queue.Queue(maxsize=self.batch_size)
+        write_q = queue.Queue(maxsize=2 * self.batch_size)
         
-        for file_path in tqdm(files_to_process, desc="Processing files", unit="file"):
+        reader = threading.Thread(target=self._read_files, args=(files_to_process, decode_q), daemon=True)
+        writer = threading.Thread(target=self._write_results, args=(write_q, output_file, results, write_errors), daemon=True)
+        if self.continuous_save:
+            self._open_csv(output_file)
+        reader.start()
+        writer.start()
+        
+        # The bar stays open until the writer is done, so it can report the last files.
+        with tqdm(total=len(files_to_process), desc="Processing files", unit="file") as progress:
+            self._progress = progress
             try:
-                caption = self._process_single_file(file_path)
-                
-                if self.format_type == 'detailed':
-                    file_info = self._get_file_info(file_path)
-                    result = (file_path.name, caption, file_info['size_kb'], 
-                             file_info['dimensions'], file_info['extension'], 
-                             file_info['date_processed'])
-                else:
-                    result = (file_path.name, caption)
-                
-                if self.continuous_save:
-                    self._save_single_result(result, output_file)
-                    if self.verbose:
-                        print(f"✓ {file_path.name}")
-                else:
-                    results.append(result)
-                    if self.verbose:
-                        print(f"✓ Queued: {file_path.name}")
-                        
-            except Exception as e:
-                if self.verbose:
-                    print(f"✗ {file_path.name}: {e}")
-                else:
-                    print(f"Error processing {file_path.name}")
-                if self.format_type == 'detailed':
-                    error_result = (file_path.name, "ERROR", 0, "unknown", 
-                                   file_path.suffix.lower(), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-                else:
-                    error_result = (file_path.name, "ERROR")
-                
-                if self.continuous_save:
-                    self._save_single_result(error_result, output_file)
-                else:
-                    results.append(error_result)
+                for batch in self._iter_batches(decode_q):
+                    for (file_path, _, size), outcome in zip(batch, self._caption_batch(batch)):
+                        write_q.put((file_path, outcome, size))
+                    progress.update(len(batch))
+            finally:
+                write_q.put(None)
+                writer.join()
+                self._progress = None
+                self._close_csv()
+        
+        if write_errors:
+            raise write_errors[0]
         
         if not self.continuous_save:
             if self.verbose:
@@ -135,28 +187,175 @@ class AITagger:
                 print(f"Unsupported file type: {path.suffix}")
                 return []
         
-        files = []
-        for file_path in path.rglob('*'):
-            if file_path.is_file() and self._is_supported(file_path):
-                files.append(file_path)
+        # Sort as Paths, which compare by component, to keep the rglob-era order.
+        return sorted(Path(file_path) for file_path in _scan(str(path), self._SUPPORTED_EXTENSIONS))
+    
+    def _sort_by_size(self, file_paths: List[Path]) -> List[Path]:
+        """Order files by size so each batch has a similar decode cost.
         
-        return sorted(files)
+        The sizes are kept for _get_file_info, so every file is only stat'ed once.
+        Files that cannot be stat'ed go last.
+        """
+
+        sizes = {}
+        for file_path in file_paths:
+            try:
+                sizes[file_path] = os.stat(file_path).st_size
+            except OSError:
+                pass
+        self._file_sizes = sizes
+        return sorted(file_paths, key=lambda file_path: sizes.get(file_path, float('inf')))
     
     def _is_supported(self, file_path: Path) -> bool:
         """Check if file type is supported."""
 
-        suffix = file_path.suffix.lower()
-        return suffix in self.SUPPORTED_IMAGES or suffix in self.SUPPORTED_VIDEOS
+        return file_path.suffix.lower() in self._SUPPORTED_EXTENSIONS
+    
+    def _read_files(self, file_paths: List[Path], decode_q: queue.Queue):
+        """Reader thread: decode files on a worker pool and queue them in order.
+        
+        Up to (prefetch - 1) * batch_size files are decoding at once, and one more batch
+        waits in decode_q, so about prefetch batches are held ahead of the one being
+        captioned. At least num_workers files are always in flight, so every worker
+        has a job. PIL and OpenCV release the GIL while decoding, so the workers run
+        in parallel.
+        """
+
+        window = max(self.num_workers, (self.prefetch - 1) * self.batch_size)
+        pending = deque()
+        
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            for file_path in file_paths:
+                pending.append((file_path, executor.submit(self._load_file, file_path)))
+                if len(pending) >= window:
+                    self._queue_loaded(*pending.popleft(), decode_q)
+            while pending:
+                self._queue_loaded(*pending.popleft(), decode_q)
+        
+        decode_q.put(None)
+    
+    def _queue_loaded(self, file_path: Path, future: Future, decode_q: queue.Queue):
+        """Wait for a decode job and hand its result (or error) to the captioner."""
+
+        try:
+            decode_q.put((file_path, *future.result()))
+        except Exception as e:
+            decode_q.put((file_path, e, None))
+    
+    def _iter_batches(self, decode_q: queue.Queue) -> Iterator[List[Tuple[Path, Any, Optional[Tuple[int, int]]]]]:
+        """Group decoded files from the reader thread into batches."""
+
+        batch = []
+        while True:
+            item = decode_q.get()
+            if item is None:
+                break
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def _caption_batch(self, batch: List[Tuple[Path, Any, Optional[Tuple[int, int]]]]) -> List[Union[str, Exception]]:
+        """Caption a batch of decoded files, sending all images through one model call.
+        
+        Returns a caption or the raised exception for each file, in input order.
+        Images are told apart from videos by their decoded payload, so suffixes
+        are only looked at once, when the file is loaded.
+        """
+
+        outcomes: List[Union[str, Exception]] = [None] * len(batch)
+        images = []
+        
+        for i, (file_path, payload, _) in enumerate(batch):
+            if isinstance(payload, Exception):
+                outcomes[i] = payload
+            elif isinstance(payload, Image.Image):
+                images.append((i, payload))
+            else:
+                try:
+                    outcomes[i] = self.video_processor.caption(*payload)
+                except Exception as e:
+                    outcomes[i] = e
+        
+        if images:
+            try:
+                captions = self.captioner.caption_batch([image for _, image in images])
+                for (i, _), caption in zip(images, captions):
+                    outcomes[i] = caption
+            except Exception as e:
+                self.logger.debug("Batch captioning failed, retrying per file: %s", e)
+                for i, image in images:
+                    outcomes[i] = self.captioner.caption(image)
+        
+        return outcomes
     
-    def _process_single_file(self, file_path: Path) -> str:
-        """Process a single file and return caption."""
+    def _write_results(self, write_q: queue.Queue, output_file: str, results: List[Tuple], errors: List[Exception]):
+        """Writer thread: turn captions into CSV rows and save or collect them.
+        
+        Whatever is already queued (up to _WRITE_CHUNK items) is handled together, so
+        a burst of results becomes a single file write. After a write error the queue
+        keeps being drained so the main thread never blocks.
+        """
+
+        done = False
+        while not done:
+            items = [write_q.get()]
+            while len(items) < self._WRITE_CHUNK:
+                try:
+                    items.append(write_q.get_nowait())
+                except queue.Empty:
+                    break
+            # The end marker is the last item ever queued.
+            done = items[-1] is None
+            if done:
+                items.pop()
+            if errors or not items:
+                continue
+            try:
+                rows = [self._format_result(*item) for item in items]
+                if self.continuous_save:
+                    self._save_rows(rows)
+                else:
+                    results.extend(rows)
+            except Exception as e:
+                errors.append(e)
+    
+    def _format_result(self, file_path: Path, outcome: Union[str, Exception],
+                       size: Optional[Tuple[int, int]] = None) -> Tuple:
+        """Build the CSV row for a processed file; size is the (width, height) found while decoding."""
+
+        if isinstance(outcome, Exception):
+            # tqdm.write prints above the progress bar instead of through it.
+            if self.verbose:
+                tqdm.write(f"✗ {file_path.name}: {outcome}")
+            else:
+                tqdm.write(f"Error processing {file_path.name}")
+            if self.format_type == 'detailed':
+                return (file_path.name, "ERROR", 0, "unknown", 
+                        file_path.suffix.lower(), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            return (file_path.name, "ERROR")
+        
+        if self.verbose and self._progress is not None:
+            # Shown next to the progress bar; printing would break the bar onto new lines.
+            self._progress.set_postfix_str(f"✓ {file_path.name}" if self.continuous_save else f"✓ Queued: {file_path.name}")
+        if self.format_type == 'detailed':
+            file_info = self._get_file_info(file_path, size)
+            return (file_path.name, outcome, file_info['size_kb'], 
+                    file_info['dimensions'], file_info['extension'], 
+                    file_info['date_processed'])
+        return (file_path.name, outcome)
+    
+    def _load_file(self, file_path: Path) -> Tuple[Any, Optional[Tuple[int, int]]]:
+        """Decode a single file into the input its processor captions and its (width, height)."""
 
         suffix = file_path.suffix.lower()
         
-        if suffix in self.SUPPORTED_IMAGES:
-            return self.image_processor.process(file_path)
-        elif suffix in self.SUPPORTED_VIDEOS:
-            return self.video_processor.process(file_path)
+        if suffix in self._IMAGE_EXTENSIONS:
+            return self.image_processor.load(file_path)
+        elif suffix in self._VIDEO_EXTENSIONS:
+            return self.video_processor.load(file_path)
         else:
             raise ValueError(f"Unsupported file type: {suffix}")
     
@@ -175,31 +374,49 @@ class AITagger:
 
         with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
-            if self.format_type == 'detailed':
-                writer.writerow(['filename', 'caption', 'size_kb', 'dimensions', 'file_type', 'date_processed'])
-            else:
-                writer.writerow(['filename', 'caption'])
+            writer.writerow(self._csv_header())
             writer.writerows(results)
     
-    def _ensure_csv_headers(self, output_file: str):
-        """Ensure CSV file exists with headers."""
+    def _csv_header(self) -> List[str]:
+        """Column names for the selected output format."""
 
-        if not os.path.exists(output_file):
-            with open(output_file, 'w', newline='', encoding='utf-8') as csv_file:
-                writer = csv.writer(csv_file, quoting=csv.QUOTE_MINIMAL)
-                if self.format_type == 'detailed':
-                    writer.writerow(['filename', 'caption', 'size_kb', 'dimensions', 'file_type', 'date_processed'])
-                else:
-                    writer.writerow(['filename', 'caption'])
+        if self.format_type == 'detailed':
+            return ['filename', 'caption', 'size_kb', 'dimensions', 'file_type', 'date_processed']
+        return ['filename', 'caption']
+
+    def _open_csv(self, output_file: str):
+        """Open the CSV file once for continuous saving, writing the header if it is empty."""
+
+        self._csv_fh = open(output_file, 'a', newline='', encoding='utf-8', buffering=self._CSV_BUFFER_SIZE)
+        self._csv_fh.seek(0, os.SEEK_END)
+        self._rows_since_flush = 0
+        if self._csv_fh.tell() == 0:
+            csv.writer(self._csv_fh, quoting=csv.QUOTE_MINIMAL).writerow(self._csv_header())
             if self.verbose:
                 print(f"Created new CSV file: {output_file}")
 
-    def _save_single_result(self, result: Tuple, output_file: str):
-        """Save a single result to CSV file."""
+    def _close_csv(self):
+        """Flush, sync to disk and close the continuous-save CSV file, if open."""
 
-        with open(output_file, 'a', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(result)
+        if self._csv_fh is not None:
+            self._csv_fh.flush()
+            os.fsync(self._csv_fh.fileno())
+            self._csv_fh.close()
+            self._csv_fh = None
+
+    def _save_rows(self, rows: List[Tuple]):
+        """Serialize rows in memory and append them to the open CSV file with one write.
+        
+        The file is flushed every force_flush_after rows.
+        """
+
+        buffer = io.StringIO()
+        csv.writer(buffer, quoting=csv.QUOTE_MINIMAL).writerows(rows)
+        self._csv_fh.write(buffer.getvalue())
+        self._rows_since_flush += len(rows)
+        if self._rows_since_flush >= self.force_flush_after:
+            self._csv_fh.flush()
+            self._rows_since_flush = 0
 
     def _get_existing_files(self, output_file: str) -> Set[str]:
         """Get set of filenames that have already been processed."""
@@ -210,12 +427,19 @@ class AITagger:
             return existing_files
             
         try:
-            with open(output_file, 'r', newline='', encoding='utf-8') as csv_file:
-                reader = csv.reader(csv_file)
-                next(reader, None)  
-                for row in reader:
-                    if row and len(row) >= 1:  
-                        existing_files.add(row[0])
+            # Only the filename column is needed, so split raw lines instead of parsing
+            # every field; lines whose first field is quoted go through csv.reader.
+            with open(output_file, 'rb') as csv_file:
+                next(csv_file, None)  
+                for line in csv_file:
+                    if line.startswith(b'"'):
+                        row = next(csv.reader([line.decode('utf-8')]), None)
+                        if row:
+                            existing_files.add(row[0])
+                    else:
+                        filename = line.split(b',', 1)[0].rstrip(b'\r\n')
+                        if filename:
+                            existing_files.add(filename.decode('utf-8'))
             
             if self.verbose:
                 print(f"Found {len(existing_files)} files already in CSV")
@@ -226,25 +450,23 @@ class AITagger:
             
         return existing_files
     
-    def _get_file_info(self, file_path: Path) -> Dict[str, str]:
-        """Get additional file information."""
+    def _get_file_info(self, file_path: Path, size: Optional[Tuple[int, int]] = None) -> Dict[str, str]:
+        """Get additional file information.
+        
+        Dimensions come from the decode step, so the file is not opened a second time.
+        """
 
         try:
-            stats = file_path.stat()
+            file_size = self._file_sizes.get(file_path)
+            if file_size is None:
+                file_size = file_path.stat().st_size
             info = {
-                'size_kb': round(stats.st_size / 1024, 1),
+                'size_kb': round(file_size / 1024, 1),
                 'extension': file_path.suffix.lower(),
                 'date_processed': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'dimensions': 'N/A'
+                'dimensions': f"{size[0]}x{size[1]}" if size else 'N/A'
             }
             
-            if file_path.suffix.lower() in self.SUPPORTED_IMAGES:
-                try:
-                    with Image.open(file_path) as img:
-                        info['dimensions'] = f"{img.width}x{img.height}"
-                except Exception:
-                    info['dimensions'] = 'unknown'
-            
             return info
         
         except Exception: